@@ -67,15 +67,17 @@ std::set<std::string> StringSplit(const std::string& str) {
 
 void RemoveOp(pir::Block* block, pir::Operation* op) {
   bool remove_op = true;
+  // only remove the op once none of its results is used any more
   for (auto& item : op->results()) {
-    if (item.HasOneUse()) {
+    if (!item.use_empty()) {
       remove_op = false;
       break;
     }
   }
   if (remove_op) {
-    auto op_iter = std::find(block->begin(), block->end(), *op);
-    block->erase(op_iter);
+    // erase through the op's own list node instead of searching the block for
+    // it, which made every removal linear in the size of the block.
+    block->erase(*op);
   }
 }
 
@@ -317,7 +319,7 @@ void DecompProgram::construct_dst_vars(
     const std::string& op_name,
     const std::vector<pir::Value>& orig_outs,
     const std::vector<pir::Value>& decomp_outs,
-    std::unordered_map<pir::Value, int> orig_vars_dict,
+    const std::unordered_map<pir::Value, int>& orig_vars_dict,
     std::vector<pir::Value>* tar_vars) {
   PADDLE_ENFORCE_EQ(
       orig_outs.size(),
@@ -329,8 +331,9 @@ void DecompProgram::construct_dst_vars(
           orig_outs.size(),
           decomp_outs.size()));
   for (size_t i = 0; i < orig_outs.size(); i++) {
-    if (orig_vars_dict.find(orig_outs[i]) != orig_vars_dict.end()) {
-      (*tar_vars)[orig_vars_dict[orig_outs[i]]] = decomp_outs[i];
+    auto iter = orig_vars_dict.find(orig_outs[i]);
+    if (iter != orig_vars_dict.end()) {
+      (*tar_vars)[iter->second] = decomp_outs[i];
     }
   }
 }
@@ -344,19 +347,12 @@ std::vector<pir::Value> DecompProgram::get_dst_vars() {
 }
 
 bool DecompProgram::enable_decomp_by_filter(const std::string& op_name) {
-  bool flag = true;
-
-  if (whitelist_.size() > 0) {
-    if (whitelist_.find(op_name) == whitelist_.end()) {
-      flag = false;
-    }
+  if (whitelist_.size() > 0 && whitelist_.find(op_name) == whitelist_.end()) {
+    return false;
   }
-  auto from_flag_blacklist = StringSplit(FLAGS_prim_forward_blacklist);
-  if (from_flag_blacklist.size() > 0)
-    blacklist_.insert(from_flag_blacklist.begin(), from_flag_blacklist.end());
-  if (blacklist_.size() > 0 && blacklist_.find(op_name) != blacklist_.end())
-    flag = false;
-  return flag;
+  // blacklist_ has been merged with FLAGS_prim_forward_blacklist in
+  // decomp_program(), so it is not parsed again for every op.
+  return blacklist_.find(op_name) == blacklist_.end();
 }
 
 std::vector<std::vector<pir::Value>> call_decomp_rule(pir::Operation* op) {
@@ -375,9 +371,9 @@ void DecompProgram::decomp_program() {
   for (size_t i = 0; i < src_vars_.size(); i++) {
     orig_vars_dict[src_vars_[i]] = static_cast<int>(i);
   }
-  std::ostringstream orig_prog_stream;
-  program_->Print(orig_prog_stream);
   if (VLOG_IS_ON(4)) {
+    std::ostringstream orig_prog_stream;
+    program_->Print(orig_prog_stream);
     std::cout << "[Prim] Origin program before decomp :\n"
               << orig_prog_stream.str() << std::endl;
   }
@@ -385,12 +381,14 @@ void DecompProgram::decomp_program() {
   if (!paddle::prim::PrimCommonUtils::IsFwdPrimEnabled()) {
     return;
   }
+  auto from_flag_blacklist = StringSplit(FLAGS_prim_forward_blacklist);
+  blacklist_.insert(from_flag_blacklist.begin(), from_flag_blacklist.end());
   std::vector<pir::Value> tar_vars(src_vars_.size());
   pir::Block* block = program_->block();
   decomp_block(block, orig_vars_dict, tar_vars);
-  std::ostringstream decomp_prog_stream;
-  program_->Print(decomp_prog_stream);
   if (VLOG_IS_ON(4)) {
+    std::ostringstream decomp_prog_stream;
+    program_->Print(decomp_prog_stream);
     std::cout << "[Prim] New program after decomp :\n"
               << decomp_prog_stream.str() << std::endl;
   }
@@ -421,7 +419,7 @@ void DecompProgram::decomp_block(
       decomp_block(&sub_body, orig_vars_dict, tar_vars);
     }
     bool enable_prim =
-        has_decomp_rule(*op) && enable_decomp_by_filter(op->name());
+        enable_decomp_by_filter(op->name()) && has_decomp_rule(*op);
     if (enable_prim && FLAGS_prim_skip_dynamic &&
         check_decomp_dynamic_shape(op)) {
       enable_prim = false;
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
-import typing
 import warnings
 
 import paddle
@@ -31,23 +30,42 @@ from . import register
 
 logger = logging.getLogger(__name__)
 
+_OUT_GRAD_NAMES = frozenset(("out_grad", "Out_grad", "loss_grad"))
+
+_BWD_OP_SUFFIXES = ("_grad", "_grad_")
+
+# input names only depend on the op definition, cache them by op name
+_op_input_names_cache = {}
+
+
+def _get_input_names(op):
+    op_name = op.name()
+    input_names = _op_input_names_cache.get(op_name)
+    if input_names is None:
+        input_names = op.get_input_names()
+        _op_input_names_cache[op_name] = input_names
+    return input_names
+
 
 def _build_tensor_tuple(xs):
     if isinstance(xs, pir.Value):
         return (xs,)
-    elif isinstance(xs, typing.Sequence):
+    elif isinstance(xs, tuple):
+        return xs
+    elif isinstance(xs, list):
         return tuple(xs)
-    return TypeError(f"Type {type(xs)} is not supported.")
+    raise TypeError(f"Type {type(xs)} is not supported.")
 
 
 def _analyse_decomp_results(orig_outs, decomp_outs, op):
     assert len(orig_outs) == len(decomp_outs)
+    op_name = op.name()
     res = []
     for idx, value in enumerate(decomp_outs):
         if isinstance(orig_outs[idx], pir.Value):
             if (
-                op.name() in decomp_ops_contain_unused_output.keys()
-                and idx in decomp_ops_contain_unused_output[op.name()]
+                op_name in decomp_ops_contain_unused_output
+                and idx in decomp_ops_contain_unused_output[op_name]
             ):
                 assert value[0] is None
             else:
@@ -67,15 +85,14 @@ def _prepare_python_api_arguments(op):
     """
     combine_op_name = "builtin.combine"
     inputs = []
-    for x in op.operands():
-        input = x.source()
+    for input in op.operands_source():
         if input.initialized():
             prev_op = input.get_defining_op()
             if (
                 isinstance(prev_op, Operation)
                 and prev_op.name() == combine_op_name
             ):
-                input = [item.source() for item in prev_op.operands()]
+                input = prev_op.operands_source()
             inputs.append(input)
         else:
             # for optional input, such as scale for layer_norm op,
@@ -87,26 +104,26 @@ def _prepare_python_api_arguments(op):
     if op.name() == combine_op_name:
         return (inputs,)
 
-    api_arguments = inputs + [op.attrs()[x] for x in op.get_attr_names()]
+    attrs = op.attrs()
+    api_arguments = inputs + [attrs[x] for x in op.get_attr_names()]
     return tuple(api_arguments)
 
 
 def _check_prim_dynamic(op):
     combine_op_name = "builtin.combine"
     inputs = []
-    for x in op.operands():
-        input = x.source()
+    for input in op.operands_source():
         if input.initialized():
             prev_op = input.get_defining_op()
             if (
                 isinstance(prev_op, Operation)
                 and prev_op.name() == combine_op_name
             ):
-                for item in prev_op.operands():
-                    shape = item.source().shape
+                for item in prev_op.operands_source():
+                    shape = item.shape
                     if -1 in shape:
                         warnings.warn(
-                            f"Decomp op does not support dynamic shape -1, but got shape {item.source().shape} in inputs of op {op.name()} "
+                            f"Decomp op does not support dynamic shape -1, but got shape {shape} in inputs of op {op.name()} "
                         )
                         return True
             else:
@@ -136,6 +153,7 @@ def _check_op_results(
         f'but len(orig_outs) = {len(orig_outs)} and len(new_outs) = {len(new_outs)}'
     )
 
+    record_dst_vars = orig_vars is not None and dst_vars is not None
     for orig_out, new_out in zip(
         orig_outs,
         new_outs,
@@ -150,28 +168,26 @@ def _check_op_results(
             # to keep same as phi op definition, orig_out may receive None
             continue
         elif new_out is not None:
-            if orig_vars is not None and dst_vars is not None:
-                if orig_out in orig_vars:
-                    dst_vars[orig_vars[orig_out]] = new_out
-            orig_dtype = orig_out.dtype
-            new_dtype = new_out.dtype
-            orig_shape = orig_out.shape
-            new_shape = new_out.shape
-            assert orig_dtype == new_dtype, (
-                f'when replace origin op {op_name} with composite rule, origin out dtype should be equal to new out dtype, '
-                f'but orig_out dtype={orig_dtype} and new_out dtype={new_dtype}'
-            )
-            assert (
-                -1 not in new_shape
-            ), f'when replace origin op {op_name} with composite rule, composite out shape has -1.'
-            assert orig_shape == new_shape, (
-                f'when replace origin op {op_name} with composite rule, origin out shape should be equal to new out shape, '
-                f'but orig_out shape={orig_shape} and new_out shape={new_shape}'
-            )
-            assert not (orig_out is None) ^ (
-                new_out is None
-            ), "orig_out and new_out should match."
-        return
+            if record_dst_vars and orig_out in orig_vars:
+                dst_vars[orig_vars[orig_out]] = new_out
+            # the following checks only consist of asserts, skip reading dtype and shape
+            # through pybind when asserts are disabled (python -O)
+            if __debug__:
+                orig_dtype = orig_out.dtype
+                new_dtype = new_out.dtype
+                orig_shape = orig_out.shape
+                new_shape = new_out.shape
+                assert orig_dtype == new_dtype, (
+                    f'when replace origin op {op_name} with composite rule, origin out dtype should be equal to new out dtype, '
+                    f'but orig_out dtype={orig_dtype} and new_out dtype={new_dtype}'
+                )
+                assert (
+                    -1 not in new_shape
+                ), f'when replace origin op {op_name} with composite rule, composite out shape has -1.'
+                assert orig_shape == new_shape, (
+                    f'when replace origin op {op_name} with composite rule, origin out shape should be equal to new out shape, '
+                    f'but orig_out shape={orig_shape} and new_out shape={new_shape}'
+                )
 
 
 def decompose(
@@ -201,6 +217,8 @@ def decompose(
     Returns:
         dst_vars (list): A list contains all vars which replace origin ones in src_vars.
     """
+    if not core._is_fwd_prim_enabled():
+        return list(src_vars)
     blacklist = core.prim_config["forward_blacklist"] | blacklist
     return core.sinking_decomp(program, src_vars, blacklist, whitelist)
 
@@ -230,8 +248,8 @@ def _check_op(
     if fwd_op is None or fwd_op.name() + "_grad" != bwd_op.name():
         return False
 
-    bwd_op_input_names = bwd_op.get_input_names()
-    bwd_inputs = [x.source() for x in bwd_op.operands()]
+    bwd_op_input_names = _get_input_names(bwd_op)
+    bwd_inputs = bwd_op.operands_source()
     assert len(bwd_op_input_names) == len(
         bwd_inputs
     ), "backward op names do not match backward op inputs"
@@ -239,13 +257,13 @@ def _check_op(
     for idx, name in enumerate(bwd_op_input_names):
         if "_grad" not in name:
             fwd_op_related_inputs_outputs.append(bwd_inputs[idx])
-    fwd_inputs = [x.source() for x in fwd_op.operands()]
+    fwd_inputs = fwd_op.operands_source()
     fwd_outputs = fwd_op.results()
+    fwd_inputs_and_outputs = ValueSet(fwd_inputs) | ValueSet(fwd_outputs)
     fwd_vec_inputs = [
-        x.source()
-        for x in fwd_op.operands()
-        if x.source().initialized()
-        and x.source().get_defining_op().name() == "builtin.combine"
+        x
+        for x in fwd_inputs
+        if x.initialized() and x.get_defining_op().name() == "builtin.combine"
     ]
 
     inserted_op_name_list = ["pd_op.full_int_array", "pd_op.full"]
@@ -263,8 +281,7 @@ def _check_op(
                 return False
         else:  # for pir::VectorType<paddle::dialect::DenseTensorType>
             if not (
-                operand in ValueSet(fwd_inputs)
-                or operand in ValueSet(fwd_outputs)
+                operand in fwd_inputs_and_outputs
                 or operand.get_defining_op().name() in inserted_op_name_list
             ):
                 return False
@@ -273,11 +290,10 @@ def _check_op(
 
 
 def _get_fwd_op(bwd_op, grad_var_to_var):
-    bwd_op_input_names = bwd_op.get_input_names()
-    out_grad_name = ["out_grad", "Out_grad", "loss_grad"]
+    bwd_op_input_names = _get_input_names(bwd_op)
     for idx, input_name in enumerate(bwd_op_input_names):
-        if input_name in out_grad_name:
-            out_grad = bwd_op.operand(idx).source()
+        if input_name in _OUT_GRAD_NAMES:
+            out_grad = bwd_op.operand_source(idx)
             if out_grad in grad_var_to_var:
                 out = grad_var_to_var[out_grad]
                 fwd_op = out.get_defining_op()
@@ -285,8 +301,25 @@ def _get_fwd_op(bwd_op, grad_var_to_var):
     return None
 
 
+def _get_decomp_rule(op_name, op, decomp_rule_cache=None):
+    '''
+    Get the python decomp rule and whether op has sink decomp rule.
+    Both of them only depend on op name, so results are cached by op name in decomp_rule_cache if given.
+    '''
+    if decomp_rule_cache is not None and op_name in decomp_rule_cache:
+        return decomp_rule_cache[op_name]
+    rule = (register.get_decomp_rule(op_name), has_decomp(op))
+    if decomp_rule_cache is not None:
+        decomp_rule_cache[op_name] = rule
+    return rule
+
+
 def _decomp_fwd_op(
-    block: Block, fwd_op: pir.Operation, grad_var_to_var: dict, prev_op=None
+    block: Block,
+    fwd_op: pir.Operation,
+    grad_var_to_var: dict,
+    prev_op=None,
+    decomp_rule_cache=None,
 ) -> tuple:
     '''
     Decompose the forward op into a list of primitive ops.
@@ -296,29 +329,34 @@ def _decomp_fwd_op(
         grad_var_to_var (dict): a dict obtained from distributed processing,
             which maps the backward grad variable to its corresponding forward variable.
         prev_op (pir.Operation): the previous op of fwd_op in the block. If prev_op is builtin.combine, insertion point when decomposing fwd_op will be set to prev_op.
+        decomp_rule_cache (dict): a dict which caches decomp rules by op name, shared by all ops in the same pass.
     Returns:
         new_outputs (tuple(Value)): the new outputs after decomposing.
         has_decomposed: whether the forward op has been successfully decomposed.
+    Note:
+        The caller must hold program_guard of block.program.
     '''
+    op_name = fwd_op.name()
+    orig_outs = fwd_op.results()
+    decom_rule, has_sink_decomp_rule = _get_decomp_rule(
+        op_name, fwd_op, decomp_rule_cache
+    )
+    lower = decom_rule or has_sink_decomp_rule
+
+    if lower:
+        # step1: check dynamic shape, currently not supported
+        if _check_prim_dynamic(fwd_op):
+            return None, False
+
+        # step2: check insertion point, if prev_op is builtin.combine (such as concat op), insertion point will be set to prev_op
+        # save the current insertion point and restore it at the end, because the op it is set to here may be removed below
+        prev_insertion_point = pir.get_current_insertion_point()
+        if prev_op is not None:
+            pir.set_insertion_point(prev_op)
+        else:
+            pir.set_insertion_point(fwd_op)
 
-    with pir.core.program_guard(block.program):
-        op_name = fwd_op.name()
-        orig_outs = fwd_op.results()
-        decom_rule = register.get_decomp_rule(op_name)
-        has_sink_decomp_rule = has_decomp(fwd_op)
-        lower = decom_rule or has_sink_decomp_rule
-
-        if lower:
-            # step1: check dynamic shape, currently not supported
-            if _check_prim_dynamic(fwd_op):
-                return None, False
-
-            # step2: check insertion point, if prev_op is builtin.combine (such as concat op), insertion point will be set to prev_op
-            if prev_op is not None:
-                pir.set_insertion_point(prev_op)
-            else:
-                pir.set_insertion_point(fwd_op)
-
+        try:
             # step3: decompose op, and get new outputs
             input_args = _prepare_python_api_arguments(fwd_op)
             if has_sink_decomp_rule:
@@ -336,74 +374,64 @@ def _decomp_fwd_op(
             )
 
             # step5: replace original op with new ops, replace original output with new outputs
-            if fwd_op.name() in decomp_ops_contain_unused_output.keys():
+            unused_outputs = decomp_ops_contain_unused_output.get(op_name)
+            if unused_outputs is not None:
                 for idx in range(len(orig_outs)):
-                    if (
-                        idx
-                        not in decomp_ops_contain_unused_output[fwd_op.name()]
-                    ):
+                    if idx not in unused_outputs:
                         orig_outs[idx].replace_all_uses_with(new_outs[idx])
             else:
-                if fwd_op.name() in decomp_ops_contain_unused_output.keys():
-                    orig_outs[0].replace_all_uses_with(new_outs[0])
-                else:
-                    fwd_op.replace_all_uses_with(new_outs)
+                fwd_op.replace_all_uses_with(new_outs)
             block.remove_op(fwd_op)
 
-            # step6: remove redundant prev_op (builtin.combine)
-            if prev_op is not None:
-                remove_op = True
-                for item in prev_op.results():
-                    if item.has_one_use():
-                        remove_op = False
-                        break
-                if remove_op:
-                    block.remove_op(prev_op)
-                prev_op = None
-            return new_outs, True
+            # step6: remove redundant prev_op (builtin.combine) once fwd_op was its last user
+            if prev_op is not None and all(
+                item.use_empty() for item in prev_op.results()
+            ):
+                block.remove_op(prev_op)
+        finally:
+            pir.set_insertion_point(prev_insertion_point)
+        return new_outs, True
 
-        else:
-            return tuple(orig_outs), False
+    else:
+        return tuple(orig_outs), False
 
 
-def _prepare_inputs(fwd_op):
+def _prepare_inputs(fwd_inputs):
     new_inputs = []
-    for input in fwd_op.operands():
+    for input in fwd_inputs:
         if (
-            input.source().initialized()
-            and input.source().get_defining_op().name() == "builtin.combine"
+            input.initialized()
+            and input.get_defining_op().name() == "builtin.combine"
         ):  # for pir::VectorType<paddle::dialect::DenseTensorType>
-            builtin_combine_op = input.source().get_defining_op()
+            builtin_combine_op = input.get_defining_op()
             new_input = [
                 builtin_combine_op.operand_source(i)
                 for i in range(0, builtin_combine_op.num_operands())
             ]
             new_inputs.append(new_input)
         else:
-            new_inputs.append([input.source()])  # for DenseTensorType
+            new_inputs.append([input])  # for DenseTensorType
     return new_inputs
 
 
-def _prepare_grad_outputs(fwd_op, bwd_op):
+def _prepare_grad_outputs(fwd_op, bwd_op, fwd_inputs, bwd_inputs):
     # check forward outputs and backward inputs
     fwd_outputs = fwd_op.results()
     fwd_output_names = fwd_op.get_output_names()
     assert len(fwd_output_names) == len(
         fwd_outputs
     ), "forward op output names do not match forward op outputs"
-    bwd_inputs = [x.source() for x in bwd_op.operands()]
-    bwd_input_names = bwd_op.get_input_names()
+    bwd_input_names = _get_input_names(bwd_op)
     assert len(bwd_input_names) == len(
         bwd_inputs
     ), "backward op input names do not match backward op inputs"
 
     # cut gradients from backward op's inputs
-    fwd_inputs = [x.source() for x in fwd_op.operands()]
+    fwd_inputs_and_outputs = ValueSet(fwd_inputs) | ValueSet(fwd_outputs)
     fwd_vec_inputs = [
-        x.source()
-        for x in fwd_op.operands()
-        if x.source().initialized()
-        and x.source().get_defining_op().name() == "builtin.combine"
+        x
+        for x in fwd_inputs
+        if x.initialized() and x.get_defining_op().name() == "builtin.combine"
     ]
     grad_outputs = []
     grad_output_names = []
@@ -421,9 +449,8 @@ def _prepare_grad_outputs(fwd_op, bwd_op):
                 grad_outputs.append([bwd_input])
                 grad_output_names.append(bwd_input_names[i])
         else:
-            if not (
-                bwd_input in ValueSet(fwd_inputs)
-                or bwd_input in ValueSet(fwd_outputs)
+            if (
+                bwd_input not in fwd_inputs_and_outputs
             ):  # for paddle::dialect::DenseTensorType
                 grad_outputs.append([bwd_input])
                 grad_output_names.append(bwd_input_names[i])
@@ -461,16 +488,31 @@ def _upgrade_grad_var_to_var(
 ):
     assert grad_var_to_var is not None, "grad_var_to_var should not be None"
     if orig_grads is not None and new_grads is not None:
-        for idx, grad_input in enumerate(orig_grads):
+        # pop all stale grads before inserting new ones, so that a new grad can not be
+        # popped again when it is the same value as one of the following orig grads
+        updates = []
+        for grad_input, new_grad in zip(orig_grads, new_grads):
             if grad_input in grad_var_to_var:
-                grad_var_to_var[new_grads[idx]] = grad_var_to_var.pop(
-                    grad_input
-                )
+                updates.append((new_grad, grad_var_to_var.pop(grad_input)))
+        for new_grad, var in updates:
+            grad_var_to_var[new_grad] = var
     if orig_outs is not None and new_outs is not None:
+        orig_outs_idx = ValueDict()
+        for i, orig_out in enumerate(orig_outs):
+            orig_outs_idx[orig_out] = i
         for grad_var, var in grad_var_to_var.items():
-            for i, orin_var in enumerate(orig_outs):
-                if var.is_same(orin_var):
-                    grad_var_to_var[grad_var] = new_outs[i]
+            if var in orig_outs_idx:
+                grad_var_to_var[grad_var] = new_outs[orig_outs_idx[var]]
+
+
+def _move_appended_ops_before(block, op, num_ops_before):
+    '''move the ops appended to the end of block (after its first num_ops_before ops) in front of op, keeping their order'''
+    # take the appended ops from the back one by one, so that block.ops is never built
+    insert_before = op
+    for _ in range(len(block) - num_ops_before):
+        appended_op = block.back()
+        appended_op.move_before(insert_before)
+        insert_before = appended_op
 
 
 def _decomp_bwd_with_vjp(
@@ -484,28 +526,32 @@ def _decomp_bwd_with_vjp(
     If forward op has composite vjp rules (including custom vjp), call call_vjp() to get a list of primitive operators in backward graph, then replace backward op.
     '''
     # step1: prepare arguments for call_vjp()
-    fwd_inputs_ = _prepare_inputs(fwd_op)
+    fwd_inputs = fwd_op.operands_source()
+    bwd_inputs = bwd_op.operands_source()
+    fwd_inputs_ = _prepare_inputs(fwd_inputs)
     fwd_outputs_ = [[fwd_output] for fwd_output in fwd_op.results()]
-    grad_outputs_ = _prepare_grad_outputs(fwd_op, bwd_op)
+    grad_outputs_ = _prepare_grad_outputs(
+        fwd_op, bwd_op, fwd_inputs, bwd_inputs
+    )
     stop_gradients_ = _prepare_stop_gradients(fwd_inputs_, bwd_op.results())
 
     # step2: call call_vjp() to get a list of primitive operators which has the same meaning as the backward op
-    bwd_op_idx = block.ops.index(bwd_op)
-    before_num_ops = len(block.ops)
+    before_num_ops = len(block)
     new_grad_inputs = core.call_vjp(
         fwd_op, fwd_inputs_, fwd_outputs_, grad_outputs_, stop_gradients_
     )
-    after_num_ops = len(block.ops)
+    after_num_ops = len(block)
     num_appended_ops = after_num_ops - before_num_ops
 
     # if forward op has no composite vjp rules, call_vjp() appends the same op as original backward op, skip decomposing, return False
-    if num_appended_ops == 1 and block.ops[-1].name() == bwd_op.name():
-        block.remove_op(block.ops[-1])
+    last_op = block.back()
+    if num_appended_ops == 1 and last_op.name() == bwd_op.name():
+        block.remove_op(last_op)
         return None, False
     else:
         # step3: record new outputs of the decomposed backward op
-        if block.ops[-1].name() == "builtin.split":
-            new_grad_inputs = [[block.ops[-1].operand(0).source()]]
+        if last_op.name() == "builtin.split":
+            new_grad_inputs = [[last_op.operand_source(0)]]
         res = []
         for grad_input in new_grad_inputs:
             if grad_input[0] is not None and grad_input[0].initialized():
@@ -522,10 +568,7 @@ def _decomp_bwd_with_vjp(
         )
 
         # step5: replace original backward op with new primitive ops
-        insert_idx = bwd_op_idx
-        for i in range(before_num_ops, after_num_ops):
-            block.move_op(block.ops[i], insert_idx)
-            insert_idx += 1
+        _move_appended_ops_before(block, bwd_op, before_num_ops)
         bwd_op.replace_all_uses_with(res)
         block.remove_op(bwd_op)
 
@@ -551,15 +594,15 @@ def _decomp_bwd_without_vjp(
         )
 
     # step1: prepare arguments for grad()
-    bwd_inputs = [x.source() for x in bwd_op.operands()]
+    bwd_inputs = bwd_op.operands_source()
     grad_inputs = bwd_op.results()
+    fwd_inputs_and_outputs = ValueSet(fwd_inputs) | ValueSet(
+        fwd_outputs_after_decompose
+    )
     grad_outputs = tuple(
         bwd_input
         for bwd_input in bwd_inputs
-        if not (
-            bwd_input in ValueSet(fwd_inputs)
-            or bwd_input in ValueSet(fwd_outputs_after_decompose)
-        )
+        if bwd_input not in fwd_inputs_and_outputs
     )
     fwd_outputs_ = tuple(
         grad_var_to_var[grad_output] for grad_output in grad_outputs
@@ -571,10 +614,8 @@ def _decomp_bwd_without_vjp(
     )
 
     # step2: call grad() to get a list of primitive operators which has the same meaning as the backward op
-    bwd_op_idx = block.ops.index(bwd_op)
-    before_num_ops = len(block.ops)
+    before_num_ops = len(block)
     new_grad_inputs = ir_backward.grad(fwd_outputs_, fwd_inputs_, grad_outputs)
-    after_num_ops = len(block.ops)
 
     # step3: record new outputs of the decomposed backward op
     res = []
@@ -592,10 +633,7 @@ def _decomp_bwd_without_vjp(
     )
 
     # step5: replace original backward op with new primitive ops
-    insert_idx = bwd_op_idx
-    for i in range(before_num_ops, after_num_ops):
-        block.move_op(block.ops[i], insert_idx)
-        insert_idx += 1
+    _move_appended_ops_before(block, bwd_op, before_num_ops)
     bwd_op.replace_all_uses_with(res)
     block.remove_op(bwd_op)
     has_decomposed = True
@@ -632,7 +670,8 @@ def _decomp_bwd_op(
     fwd_op = _get_fwd_op(bwd_op, grad_var_to_var)
     if not _check_op(fwd_op, bwd_op):
         logger.debug(
-            f'{bwd_op.name()} can not be decomposed due to the mismatch between forward op and backward op'
+            '%s can not be decomposed due to the mismatch between forward op and backward op',
+            bwd_op.name(),
         )
         return None, False
     if _check_prim_dynamic(fwd_op) or _check_prim_dynamic(bwd_op):
@@ -651,7 +690,7 @@ def _decomp_bwd_op(
 
     if not bwd_has_decomposed:
         # try to decompose the forward op
-        fwd_inputs = [x.source() for x in fwd_op.operands()]
+        fwd_inputs = fwd_op.operands_source()
         (
             new_fwd_outputs,
             fwd_has_decomposed,
@@ -675,31 +714,24 @@ def _decomp_bwd_op(
     return new_grads, bwd_has_decomposed
 
 
-def _get_all_bwd_ops(pir_program):
-    bwd_ops = []
-    global_block = pir_program.global_block()
-    for op in global_block.ops:
-        if (
-            op.name().endswith("_grad") or op.name().endswith("_grad_")
-        ) and op.name() not in bwd_ops:
-            bwd_ops.append(op.name())
-    return bwd_ops
-
-
 def _set_prim_state():
     state = []
     prev_fwd_prim_state = core._is_fwd_prim_enabled()
     prev_bwd_prim_state = core._is_bwd_prim_enabled()
     state.append(prev_fwd_prim_state)
     state.append(prev_bwd_prim_state)
-    core._set_prim_forward_enabled(True)
-    core._set_prim_backward_enabled(True)
+    # only touch the flags which are not enabled yet
+    if not prev_fwd_prim_state:
+        core._set_prim_forward_enabled(True)
+    if not prev_bwd_prim_state:
+        core._set_prim_backward_enabled(True)
     prev_pir_api_flag = paddle.base.framework.get_flags("FLAGS_enable_pir_api")[
         "FLAGS_enable_pir_api"
     ]
-    paddle.framework.set_flags(
-        {"FLAGS_enable_pir_api": True}
-    )  # set in pir mode for operator overloading
+    if not prev_pir_api_flag:
+        paddle.framework.set_flags(
+            {"FLAGS_enable_pir_api": True}
+        )  # set in pir mode for operator overloading
     paddle.base.framework.global_var._use_pir_api_ = True
     state.append(prev_pir_api_flag)
     return state
@@ -709,114 +741,123 @@ def _reset_prim_state(state):
     assert (
         len(state) == 3
     ), "state should contain fwd_prim_state, bwd_prim_state and pir_api_state"
-    core._set_prim_forward_enabled(state[0])
-    core._set_prim_backward_enabled(state[1])
-    paddle.framework.set_flags({"FLAGS_enable_pir_api": state[2]})
+    # only restore the flags which were changed by _set_prim_state
+    if not state[0]:
+        core._set_prim_forward_enabled(False)
+    if not state[1]:
+        core._set_prim_backward_enabled(False)
+    if not state[2]:
+        paddle.framework.set_flags({"FLAGS_enable_pir_api": False})
     paddle.base.framework.global_var._use_pir_api_ = state[2]
 
 
+def _resolve_grad_vars(values):
+    if len(values) == 1:
+        return [values[0]]
+    if (
+        len(values) == 2
+        and values[1].get_defining_op().name() == "builtin.slice"
+    ):
+        return [values[1]]
+    return list(values)
+
+
+def _resolve_vars(values):
+    if len(values) == 1:
+        return [values[0]]
+    if (
+        len(values) == 2
+        and values[1].get_defining_op().name() == "builtin.slice"
+    ):
+        return [values[1]]
+    if values[-1].get_defining_op().name().endswith("_"):
+        return [values[0]]
+    return []
+
+
 def _translate_gradvartovar_to_pir(param_mapping, grad_var_to_var):
     '''translate grad_var_to_var (mapping VarDesc->VarDesc) to pir_grad_var_to_var (mapping Value->Value)'''
     pir_grad_var_to_var = ValueDict()
+    # a name may be referenced by many pairs, so resolve each one only once
+    resolved_grad_vars = {}
+    resolved_vars = {}
     for grad_var, var in grad_var_to_var.items():
-        if grad_var in param_mapping.keys() and var in param_mapping.keys():
-            if (
-                len(param_mapping[grad_var]) == 1
-                and len(param_mapping[var]) == 1
-            ):
-                new_grad_var = param_mapping[grad_var][0]
-                new_var = param_mapping[var][0]
-                pir_grad_var_to_var[new_grad_var] = new_var
-            else:
-                new_grad_vars = []
-                new_vars = []
-                if len(param_mapping[grad_var]) == 1:
-                    new_grad_vars.append(param_mapping[grad_var][0])
-                elif (
-                    len(param_mapping[grad_var]) == 2
-                    and param_mapping[grad_var][1].get_defining_op().name()
-                    == "builtin.slice"
-                ):
-                    new_grad_vars.append(param_mapping[grad_var][1])
-                else:
-                    for i in range(0, len(param_mapping[grad_var])):
-                        new_grad_vars.append(param_mapping[grad_var][i])
-
-                if len(param_mapping[var]) == 1:
-                    new_vars.append(param_mapping[var][0])
-                elif (
-                    len(param_mapping[var]) == 2
-                    and param_mapping[var][1].get_defining_op().name()
-                    == "builtin.slice"
-                ):
-                    new_vars.append(param_mapping[var][1])
-                else:
-                    last_op = param_mapping[var][-1].get_defining_op()
-                    if last_op.name().endswith("_"):
-                        new_vars.append(param_mapping[var][0])
-
-                assert len(new_vars) == 1, "translate pir_grad_var_to_var error"
-                for i in range(0, len(new_grad_vars)):
-                    pir_grad_var_to_var[new_grad_vars[i]] = new_vars[0]
+        if grad_var in param_mapping and var in param_mapping:
+            new_grad_vars = resolved_grad_vars.get(grad_var)
+            if new_grad_vars is None:
+                new_grad_vars = _resolve_grad_vars(param_mapping[grad_var])
+                resolved_grad_vars[grad_var] = new_grad_vars
+            new_vars = resolved_vars.get(var)
+            if new_vars is None:
+                new_vars = _resolve_vars(param_mapping[var])
+                resolved_vars[var] = new_vars
+
+            assert len(new_vars) == 1, "translate pir_grad_var_to_var error"
+            for new_grad_var in new_grad_vars:
+                pir_grad_var_to_var[new_grad_var] = new_vars[0]
     return pir_grad_var_to_var
 
 
 def _decomp_bwd_program(pir_program, pir_grad_var_to_var):
-    '''Traverse and decompose all backward OPs in program'''
-    with paddle.pir.core.program_guard(pir_program):
-        bwd_ops = _get_all_bwd_ops(pir_program)
-        undecomposed_bwd_ops = []
-        ops = pir_program.global_block().ops
-        for op in ops:
-            bwd_op_name = op.name()
-            if op.name() in bwd_ops:
-                _, bwd_has_decomposed = _decomp_bwd_op(
-                    pir_program.global_block(), op, pir_grad_var_to_var
-                )
-                if (
-                    not bwd_has_decomposed
-                    and bwd_op_name not in undecomposed_bwd_ops
-                ):
-                    undecomposed_bwd_ops.append(bwd_op_name)
-
-    logger.debug(
-        f'Following backward ops can not be decomposed: {undecomposed_bwd_ops}'
-    )
+    '''Traverse and decompose all backward OPs in program, the caller must hold program_guard of pir_program'''
+    undecomposed_bwd_ops = set()
+    # bind set.add once instead of looking it up for every op
+    add_undecomposed_bwd_op = undecomposed_bwd_ops.add
+    block = pir_program.global_block()
+    ops = block.ops
+    for op in ops:
+        bwd_op_name = op.name()
+        if not bwd_op_name.endswith(_BWD_OP_SUFFIXES):
+            continue
+        # inplace backward ops never match fwd_op.name() + "_grad" in _check_op,
+        # skip them before looking up their forward op
+        if bwd_op_name.endswith("_grad_"):
+            add_undecomposed_bwd_op(bwd_op_name)
+            continue
+        _, bwd_has_decomposed = _decomp_bwd_op(block, op, pir_grad_var_to_var)
+        if not bwd_has_decomposed:
+            add_undecomposed_bwd_op(bwd_op_name)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            'Following backward ops can not be decomposed: %s',
+            sorted(undecomposed_bwd_ops),
+        )
 
 
 def _decomp_fwd_program(pir_program, pir_grad_var_to_var):
-    '''Traverse and decompose all forward OPs in program'''
-    with paddle.pir.core.program_guard(pir_program):
-        ops = pir_program.global_block().ops
-        bwd_ops = _get_all_bwd_ops(pir_program)
-        # ops including compile-time infermeta, causing mismatched input shape and output shape, which is unsupported when decomposing.
-        black_fwd_ops = ["pd_op.stack", "pd_op.squeeze"]
-        undecomposed_fwd_ops = []
-
-        prev_op = None
-        for op in ops:
-            fwd_op_name = op.name()
-            if op.name() not in bwd_ops:
-                if op.name() not in black_fwd_ops:
-                    _, fwd_has_decomposed = _decomp_fwd_op(
-                        pir_program.global_block(),
-                        op,
-                        pir_grad_var_to_var,
-                        prev_op,
-                    )
-                    if (
-                        not fwd_has_decomposed
-                        and fwd_op_name not in undecomposed_fwd_ops
-                    ):
-                        undecomposed_fwd_ops.append(fwd_op_name)
-                else:
-                    if fwd_op_name not in undecomposed_fwd_ops:
-                        undecomposed_fwd_ops.append(fwd_op_name)
-            prev_op = op if op.name() == "builtin.combine" else None
-
-    logger.debug(
-        f'Following forward ops can not be decomposed: {undecomposed_fwd_ops}'
-    )
+    '''Traverse and decompose all forward OPs in program, the caller must hold program_guard of pir_program'''
+    block = pir_program.global_block()
+    ops = block.ops
+    # ops including compile-time infermeta, causing mismatched input shape and output shape, which is unsupported when decomposing.
+    black_fwd_ops = {"pd_op.stack", "pd_op.squeeze"}
+    undecomposed_fwd_ops = set()
+    add_undecomposed_fwd_op = undecomposed_fwd_ops.add
+    decomp_rule_cache = {}
+
+    prev_op = None
+    for op in ops:
+        fwd_op_name = op.name()
+        if not fwd_op_name.endswith(_BWD_OP_SUFFIXES):
+            if fwd_op_name not in black_fwd_ops:
+                _, fwd_has_decomposed = _decomp_fwd_op(
+                    block,
+                    op,
+                    pir_grad_var_to_var,
+                    prev_op,
+                    decomp_rule_cache,
+                )
+                if not fwd_has_decomposed:
+                    add_undecomposed_fwd_op(fwd_op_name)
+            else:
+                add_undecomposed_fwd_op(fwd_op_name)
+        prev_op = op if fwd_op_name == "builtin.combine" else None
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            'Following forward ops can not be decomposed: %s',
+            sorted(undecomposed_fwd_ops),
+        )
 
 
 def decompose_pir_program(pir_program, param_mapping, grad_var_to_var):
@@ -830,12 +871,15 @@ def decompose_pir_program(pir_program, param_mapping, grad_var_to_var):
     '''
     # set prim flags and pir_api flags
     state = _set_prim_state()
-    # translate grad_var_to_var to pir
-    pir_grad_var_to_var = _translate_gradvartovar_to_pir(
-        param_mapping, grad_var_to_var
-    )
-    # decompose
-    _decomp_bwd_program(pir_program, pir_grad_var_to_var)
-    _decomp_fwd_program(pir_program, pir_grad_var_to_var)
-    # reset prim flags and pir_api flags
-    _reset_prim_state(state)
+    try:
+        # translate grad_var_to_var to pir
+        pir_grad_var_to_var = _translate_gradvartovar_to_pir(
+            param_mapping, grad_var_to_var
+        )
+        # decompose, the program guard is entered once for both passes
+        with paddle.pir.core.program_guard(pir_program):
+            _decomp_bwd_program(pir_program, pir_grad_var_to_var)
+            _decomp_fwd_program(pir_program, pir_grad_var_to_var)
+    finally:
+        # reset prim flags and pir_api flags, even if decomposing fails
+        _reset_prim_state(state)
@@ -17,10 +17,10 @@
 # 2. The name and args of target op must be corresponding with standard description of op in
 #    ops.yaml or legacy_ops.yaml.
 
-import functools
-import operator
+import math
 
 from paddle.base import core
+from paddle.base.data_feeder import convert_dtype
 
 from .primitives import *  # noqa: F403
 from .primreg import REGISTER_COMPOSITE, lookup_composite
@@ -31,11 +31,21 @@ def _composite(op, *args):
     return _lowerrule(op, *args)
 
 
+def _scalar_constant(x, value):
+    """
+    Return value as a python scalar, so that it is applied to x by a scale op.
+    The attributes of scale op are float32, so for float64 x value is filled
+    as a constant tensor instead to keep its precision.
+    """
+    if convert_dtype(x.dtype) == "float64":
+        return full(x.shape if len(x.shape) == 0 else [1], value, x.dtype)
+    return value
+
+
 @REGISTER_COMPOSITE('softmax')
 def softmax_composite(x, axis):
     """define composite rule of op softmax"""
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     # Softmax need fp32 compute since it has sum op in
     dtype = convert_dtype(x.dtype)
@@ -78,7 +88,6 @@ def composite_batchnorm(
     """
 
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -97,13 +106,11 @@ def composite_batchnorm(
         1 if i in reduce_axes else s for i, s in enumerate(x.shape)
     )
 
-    half = full([1], -0.5, x.dtype)
-
     if not use_run_stat:
         batch_mean = mean(x, reduce_axes)
         temp = mean(x * x, reduce_axes)
         batch_var = temp - batch_mean * batch_mean
-        inv_std = pow((batch_var + epsilon), half)
+        inv_std = rsqrt(batch_var + epsilon)
         if data_layout == "NHWC":
             x_hat = (x - batch_mean) * inv_std
         else:
@@ -116,12 +123,12 @@ def composite_batchnorm(
     else:
         batch_mean = zeros(run_mean.shape, run_mean.dtype)
         batch_var = zeros(run_var.shape, run_var.dtype)
-        inv_std = pow((batch_var + epsilon), half)
+        inv_std = rsqrt(batch_var + epsilon)
         if data_layout == "NHWC":
-            x_hat = (x - run_mean) * pow((run_var + epsilon), half)
+            x_hat = (x - run_mean) * rsqrt(run_var + epsilon)
         else:
-            x_hat = (x - reshape(run_mean, stats_shape)) * pow(
-                (reshape(run_var, stats_shape) + epsilon), half
+            x_hat = (x - reshape(run_mean, stats_shape)) * rsqrt(
+                reshape(run_var, stats_shape) + epsilon
             )
     if data_layout == "NHWC":
         y = scale * x_hat + bias
@@ -152,7 +159,6 @@ def layernorm_composite(x, scale, bias, epsilon, begin_norm_axis):
     var = mean((x-mean(x))^2)
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -195,7 +201,6 @@ def instancenorm_composite(x, scale, bias, epsilon):
     var = mean((x-mean(x))^2)
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -238,20 +243,23 @@ def gelu_composite(x, approximate):
         0.70710678118654752440  # /* 1/sqrt(2) */ copy from gelu-kernel.cc
     )
     M_2_SQRTPI = 1.12837916709551257390  # /* 2/sqrt(pi) */
-    full_shape = x.shape if len(x.shape) == 0 else [1]
-    one = ones(full_shape, x.dtype)
-    half = full(full_shape, 0.5, x.dtype)
+    # constants are applied as python scalars where possible, which are lowered
+    # to scale ops instead of filling constant tensors for elementwise ops,
+    # 0.5 is exact in the float32 attributes of scale op for any dtype
     if approximate:
         # gelu(x) = 0.5 * x * (1 + tanh(sqrt(2 / \pi) * (x + 0.044715 * x^{3})))
-        kAlpha = full(full_shape, M_2_SQRTPI * M_SQRT1_2, x.dtype)
-        GELU_CONSTANT = full(full_shape, 0.044715, x.dtype)
-        tanh_out = tanh(kAlpha * (x + GELU_CONSTANT * x * x * x))
-        out = x * half * (one + tanh_out)
+        #         = x * (0.5 + 0.5 * tanh(...))
+        kAlpha = _scalar_constant(x, M_2_SQRTPI * M_SQRT1_2)
+        GELU_CONSTANT = _scalar_constant(x, 0.044715)
+        x2 = x * x
+        x3 = x2 * x
+        tanh_out = tanh((x + x3 * GELU_CONSTANT) * kAlpha)
+        out = x * (tanh_out * 0.5 + 0.5)
         return out
 
     else:
         # gelu(x) = 0.5 * x *  (1 + erf(x / sqrt(2)))
-        cdf = half * (one + erf(x * full(x.shape, M_SQRT1_2, x.dtype)))
+        cdf = erf(x * _scalar_constant(x, M_SQRT1_2)) * 0.5 + 0.5
         out = x * cdf
         return out
 
@@ -260,7 +268,6 @@ def gelu_composite(x, approximate):
 def mean_composite(x, axis, keepdim):
     """define composite rule of op mean"""
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -268,20 +275,27 @@ def mean_composite(x, axis, keepdim):
         x = cast(x, "float32")
 
     if axis in (None, []):
-        axis = tuple(range(0, len(x.shape)))
-    axes = (axis,) if isinstance(axis, int) else axis
-    sum_x = sum(x, axis=axes, keepdim=keepdim)
-    ele_nums_list = [x.shape[axis] for axis in axes]
-    if ele_nums_list == []:
-        value_to_fill = 1
+        # full reduction, every dim is reduced
+        sum_x = sum(x, axis=None, keepdim=keepdim)
+        ele_nums_list = list(x.shape)
     else:
-        value_to_fill = functools.reduce(operator.mul, ele_nums_list)
-    norm = fill_constant(
-        shape=[],
-        value=value_to_fill,
-        dtype=sum_x.dtype,
-    )
-    res = divide(sum_x, norm)
+        axes = (axis,) if isinstance(axis, int) else axis
+        sum_x = sum(x, axis=axes, keepdim=keepdim)
+        ele_nums_list = [x.shape[axis] for axis in axes]
+    value_to_fill = math.prod(ele_nums_list)
+    if dtype != "float64" and all(num > 0 for num in ele_nums_list):
+        # multiply by a python scalar, which is lowered to a single scale op
+        # instead of filling a constant tensor and dividing by it
+        res = sum_x * (1.0 / value_to_fill)
+    else:
+        # float64, whose 1 / value_to_fill can not be kept by the float32
+        # attribute of scale op, or zero-size or dynamic dims
+        norm = fill_constant(
+            shape=[],
+            value=value_to_fill,
+            dtype=sum_x.dtype,
+        )
+        res = divide(sum_x, norm)
     if is_amp:
         res = cast(res, dtype)
     return res
@@ -437,8 +451,6 @@ def dropout_composite(x, seed_tensor, p, is_test, mode, seed, fix_seed):
 
 
 def bernoulli(shape, dtype, p, seed=0):
-    from paddle.base.data_feeder import convert_dtype
-
     # TODO(jiabin) Fix uniform doesn't support float16 error in CINN
     new_dtype = (
         "float32" if convert_dtype(dtype) in ["float16", "uint16"] else dtype
@@ -494,7 +506,6 @@ def sigmoid_composite(x):
     res = 1 / (1 + exp(-x))
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -513,7 +524,6 @@ def silu_composite(x):
     res = x / (1 + exp(-x))
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -593,7 +603,6 @@ def sqrt_composite(x):
     res = pow(x, 0.5)
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -612,7 +621,6 @@ def pow_composite(x, y):
     res = x^y
     """
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     if dtype in ["float16", "uint16"]:
@@ -669,7 +677,6 @@ def group_norm_composite(x, scale, bias, epsilon, groups, data_layout):
     N, C, H, W = x.shape
 
     is_amp = False
-    from paddle.base.data_feeder import convert_dtype
 
     dtype = convert_dtype(x.dtype)
     # when inputs are float16 or bfloat16, convert to float32 in computing
@@ -137,5 +137,22 @@ class TestCompositeMean(unittest.TestCase):
                         self.compare_forward()
 
 
+class TestCompositeMeanFloat64(TestCompositeMean):
+    def setUp(self):
+        self.dtypes = ["float64"]
+        self.keepdim = [False, True]
+        # 1 / N is not exact in float32 for these reduced sizes
+        self.shapes = [[4, 100], [6, 20]]
+        self.axes = [-1]
+
+
+class TestCompositeMeanFloat64AxisAll(TestCompositeMean):
+    def setUp(self):
+        self.dtypes = ["float64"]
+        self.keepdim = [False, True]
+        self.shapes = [[2, 3, 4, 5], [100]]
+        self.axes = [None]
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import paddle
+from paddle.decomposition import decomp
+
+paddle.enable_static()
+
+
+class TestCheckOpResults(unittest.TestCase):
+    def setUp(self):
+        self.main_program = paddle.static.Program()
+        with paddle.static.program_guard(self.main_program):
+            self.x = paddle.static.data('x', [4, 5], dtype='float32')
+            self.y = paddle.static.data('y', [4, 5], dtype='float32')
+            self.z = paddle.static.data('z', [5, 4], dtype='float32')
+
+    def test_consistent_outputs(self):
+        decomp._check_op_results(
+            "pd_op.test", (self.x, self.y), (self.x, self.y)
+        )
+
+    def test_check_all_outputs(self):
+        # the mismatch of the second output should be detected as well
+        with self.assertRaises(AssertionError):
+            decomp._check_op_results(
+                "pd_op.test", (self.x, self.y), (self.x, self.z)
+            )
+
+
+class TestBuildTensorTuple(unittest.TestCase):
+    def test_build_tensor_tuple(self):
+        main_program = paddle.static.Program()
+        with paddle.static.program_guard(main_program):
+            x = paddle.static.data('x', [4, 5], dtype='float32')
+            y = paddle.static.data('y', [4, 5], dtype='float32')
+            self.assertEqual(len(decomp._build_tensor_tuple(x)), 1)
+            self.assertEqual(len(decomp._build_tensor_tuple([x, y])), 2)
+            self.assertEqual(len(decomp._build_tensor_tuple((x, y))), 2)
+
+    def test_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            decomp._build_tensor_tuple(1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+# Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+import paddle
+from paddle.autograd.backward_utils import ValueDict
+from paddle.autograd.ir_backward import grad
+from paddle.base import core
+from paddle.decomposition import decomp, decompose
+
+paddle.enable_static()
+
+
+def _get_op(block, op_name):
+    for op in block.ops:
+        if op.name() == op_name:
+            return op
+    return None
+
+
+class TestDecompBwdProgram(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(2024)
+        self.shape_x = [4, 5]
+        self.x = np.random.random(self.shape_x).astype("float32")
+
+    def test_decomp_bwd_after_fwd_decomposed(self):
+        # mean_grad has no composite vjp rule, it is decomposed by decomposing mean
+        # and calling grad, then tanh_grad is decomposed by its composite vjp rule
+        main_program = paddle.static.Program()
+        with paddle.static.program_guard(main_program):
+            x = paddle.static.data('x', self.shape_x, dtype='float32')
+            x.stop_gradient = False
+            tmp = paddle.tanh(x)
+            out = paddle.mean(tmp)
+            [x_grad] = grad(out, x)
+            x_grad = paddle.assign(x_grad)
+
+        block = main_program.global_block()
+        mean_grad_op = _get_op(block, "pd_op.mean_grad")
+        tanh_grad_op = _get_op(block, "pd_op.tanh_grad")
+        self.assertIsNotNone(mean_grad_op)
+        self.assertIsNotNone(tanh_grad_op)
+        out_grad_idx = mean_grad_op.get_input_names().index("out_grad")
+        grad_var_to_var = ValueDict()
+        grad_var_to_var[mean_grad_op.operand_source(out_grad_idx)] = out
+        grad_var_to_var[mean_grad_op.result(0)] = tmp
+        grad_var_to_var[tanh_grad_op.result(0)] = x
+
+        state = decomp._set_prim_state()
+        try:
+            with paddle.pir.core.program_guard(main_program):
+                decomp._decomp_bwd_program(main_program, grad_var_to_var)
+        finally:
+            decomp._reset_prim_state(state)
+
+        op_names = [op.name() for op in block.ops]
+        self.assertNotIn("pd_op.mean_grad", op_names)
+        self.assertNotIn("pd_op.tanh_grad", op_names)
+        # the ops of tanh_grad must be inserted in front of its users
+        self.assertEqual(op_names[-1], "pd_op.assign")
+
+        exe = paddle.static.Executor()
+        [res] = exe.run(main_program, feed={'x': self.x}, fetch_list=[x_grad])
+        ref = (1 - np.tanh(self.x) ** 2) / self.x.size
+        np.testing.assert_allclose(res, ref, rtol=1e-6, atol=1e-6)
+
+
+class TestDecompFwdOpWithSharedCombine(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(2024)
+        self.shape = [4, 5]
+        self.x = np.random.random(self.shape).astype("float32")
+        self.y = np.random.random(self.shape).astype("float32")
+
+    def test_shared_combine_is_kept(self):
+        main_program = paddle.static.Program()
+        with paddle.static.program_guard(main_program):
+            x = paddle.static.data('x', self.shape, dtype='float32')
+            y = paddle.static.data('y', self.shape, dtype='float32')
+            paddle.add_n([x, y])
+            concat_out0 = paddle.concat([x, y], axis=0)
+            concat_out1 = paddle.concat([x, y], axis=1)
+
+        # let add_n and both concat ops share the same builtin.combine, so that
+        # the combine still has two users after add_n is decomposed
+        block = main_program.global_block()
+        add_n_op = _get_op(block, "pd_op.add_n")
+        combine_op = add_n_op.operand_source(0).get_defining_op()
+        concat_ops = [
+            concat_out0.get_defining_op(),
+            concat_out1.get_defining_op(),
+        ]
+        for concat_op in concat_ops:
+            unused_combine_op = concat_op.operand_source(0).get_defining_op()
+            concat_op.operand(0).set_source(combine_op.result(0))
+            block.remove_op(unused_combine_op)
+
+        state = decomp._set_prim_state()
+        try:
+            with paddle.pir.core.program_guard(main_program):
+                new_outs, has_decomposed = decomp._decomp_fwd_op(
+                    block, add_n_op, ValueDict(), combine_op
+                )
+        finally:
+            decomp._reset_prim_state(state)
+
+        self.assertTrue(has_decomposed)
+        op_names = [op.name() for op in block.ops]
+        self.assertNotIn("pd_op.add_n", op_names)
+        # the combine is still used by both concat ops, so it must not be removed
+        self.assertEqual(op_names.count("builtin.combine"), 1)
+        for concat_op in concat_ops:
+            self.assertEqual(
+                concat_op.operand_source(0).get_defining_op().name(),
+                "builtin.combine",
+            )
+
+        exe = paddle.static.Executor()
+        add_n_res, concat_res0, concat_res1 = exe.run(
+            main_program,
+            feed={'x': self.x, 'y': self.y},
+            fetch_list=[new_outs[0], concat_out0, concat_out1],
+        )
+        np.testing.assert_allclose(add_n_res, self.x + self.y, rtol=1e-6)
+        np.testing.assert_allclose(
+            concat_res0, np.concatenate([self.x, self.y], axis=0), rtol=1e-6
+        )
+        np.testing.assert_allclose(
+            concat_res1, np.concatenate([self.x, self.y], axis=1), rtol=1e-6
+        )
+
+
+class TestSinkDecompWithSharedResults(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(2024)
+        self.shape = [4, 5]
+        self.x = np.random.random(self.shape).astype("float32") - 0.5
+        self.y = np.random.random(self.shape).astype("float32")
+
+    def _sink_decomp(self, main_program, src_vars, whitelist):
+        core._set_prim_forward_enabled(True)
+        try:
+            with paddle.static.program_guard(main_program):
+                new_outs = decompose(
+                    main_program, src_vars, whitelist=whitelist
+                )
+        finally:
+            core._set_prim_forward_enabled(False)
+        return new_outs
+
+    def test_result_with_multiple_users(self):
+        # every user of relu is rewired to the decomposed result, so relu must
+        # be removed although its result had several users
+        main_program = paddle.static.Program()
+        with paddle.static.program_guard(main_program):
+            x = paddle.static.data('x', self.shape, dtype='float32')
+            y = paddle.static.data('y', self.shape, dtype='float32')
+            relu_out = paddle.nn.functional.relu(x)
+            add_out = paddle.add(relu_out, y)
+            mul_out = paddle.multiply(relu_out, y)
+            sub_out = paddle.subtract(relu_out, y)
+
+        new_outs = self._sink_decomp(
+            main_program, [add_out, mul_out, sub_out], {"pd_op.relu"}
+        )
+
+        op_names = [op.name() for op in main_program.global_block().ops]
+        self.assertNotIn("pd_op.relu", op_names)
+
+        exe = paddle.static.Executor()
+        add_res, mul_res, sub_res = exe.run(
+            main_program,
+            feed={'x': self.x, 'y': self.y},
+            fetch_list=new_outs,
+        )
+        relu_ref = np.maximum(self.x, 0)
+        np.testing.assert_allclose(add_res, relu_ref + self.y, rtol=1e-6)
+        np.testing.assert_allclose(mul_res, relu_ref * self.y, rtol=1e-6)
+        np.testing.assert_allclose(sub_res, relu_ref - self.y, rtol=1e-6)
+
+    def test_split_results_with_multiple_users(self):
+        # the results of meshgrid are unpacked by builtin.split, whose results
+        # are used several times, both of them must be removed after decomposed
+        main_program = paddle.static.Program()
+        with paddle.static.program_guard(main_program):
+            x = paddle.static.data('x', [4], dtype='float32')
+            y = paddle.static.data('y', [5], dtype='float32')
+            grid_x, grid_y = paddle.meshgrid(x, y)
+            add_out = paddle.add(grid_x, grid_y)
+            mul_out = paddle.multiply(grid_x, grid_y)
+            sub_out = paddle.subtract(grid_x, grid_y)
+
+        new_outs = self._sink_decomp(
+            main_program, [add_out, mul_out, sub_out], {"pd_op.meshgrid"}
+        )
+
+        op_names = [op.name() for op in main_program.global_block().ops]
+        self.assertNotIn("pd_op.meshgrid", op_names)
+        self.assertNotIn("builtin.split", op_names)
+
+        x_np = self.x[:, 0]
+        y_np = self.y[0, :]
+        exe = paddle.static.Executor()
+        add_res, mul_res, sub_res = exe.run(
+            main_program,
+            feed={'x': x_np, 'y': y_np},
+            fetch_list=new_outs,
+        )
+        grid_x_ref, grid_y_ref = np.meshgrid(x_np, y_np, indexing="ij")
+        np.testing.assert_allclose(add_res, grid_x_ref + grid_y_ref, rtol=1e-6)
+        np.testing.assert_allclose(mul_res, grid_x_ref * grid_y_ref, rtol=1e-6)
+        np.testing.assert_allclose(sub_res, grid_x_ref - grid_y_ref, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()